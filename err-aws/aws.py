@@ -1,3 +1,7 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'err-common'))
+
 from errbot import BotPlugin, botcmd
 from optparse import OptionParser
 
@@ -6,6 +10,7 @@ from libcloud.compute.providers import get_driver
 from libcloud.compute.base import NodeImage
 from libcloud.compute.drivers.ec2 import EC2SubnetAssociation
 
+import outbox
 import time
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -28,6 +33,10 @@ class AWS(BotPlugin):
         }
         return config
 
+    def activate(self):
+        super(AWS, self).activate()
+        self.outbox = outbox.Outbox(self.send)
+        self.start_poller(self.outbox.interval, self.outbox.flush)
 
     def _connect(self):
         """ connection to aws """
@@ -76,7 +85,7 @@ class AWS(BotPlugin):
         '''
         vmname = args.pop(0)
         details = self._basic_instance_details(vmname)
-        self.send(msg.getFrom(), '{0}: {1}'.format(vmname, details), message_type=msg.getType())
+        self.outbox.send(msg.getFrom(), '{0}: {1}'.format(vmname, details), message_type=msg.getType())
 
     @botcmd
     def aws_reboot(self, msg, args):
@@ -94,7 +103,7 @@ class AWS(BotPlugin):
         else:
             response = 'Unable to complete request.'
 
-        self.send(msg.getFrom(), '{0}: {1}'.format(vm.name, response), message_type=msg.getType())
+        self.outbox.send(msg.getFrom(), '{0}: {1}'.format(vm.name, response), message_type=msg.getType())
 
 
     @botcmd
@@ -113,7 +122,7 @@ class AWS(BotPlugin):
         else:
             response = 'Unable to complete request.'
 
-        self.send(msg.getFrom(), '{0}: {1}'.format(vm.name, response), message_type=msg.getType())
+        self.outbox.send(msg.getFrom(), '{0}: {1}'.format(vm.name, response), message_type=msg.getType())
 
     @botcmd(split_args_with=' ')
     def aws_create(self, msg, args):
@@ -184,15 +193,15 @@ class AWS(BotPlugin):
                                   ex_blockdevicemappings=block_dev_mappings,
                                   ex_metadata=base_tags)
 
-        self.send(msg.getFrom(), '{0}: [1/3] Creating instance'.format(vmname), message_type=msg.getType())
+        self.outbox.progress(msg.getFrom(), vmname, '[1/3] Creating instance', message_type=msg.getType())
         # todo: actually query state of instance
         #time.sleep(30)
-        self.send(msg.getFrom(), '{0}: [2/3] Running post setup'.format(vmname), message_type=msg.getType())
+        self.outbox.progress(msg.getFrom(), vmname, '[2/3] Running post setup', message_type=msg.getType())
 
         if options['puppet']:
             # ready for puppet... let's go!
-            self.send(msg.getFrom(), '{0}: Running puppet [disabled]'.format(vmname), message_type=msg.getType())
+            self.outbox.progress(msg.getFrom(), vmname, 'Running puppet [disabled]', message_type=msg.getType())
 
-        self.send(msg.getFrom(), '{0}: [3/3] Request completed'.format(vmname), message_type=msg.getType())
-        self.send(msg.getFrom(), '{0}: {1}'.format(vmname, self._basic_instance_details(vmname)), message_type=msg.getType())
+        self.outbox.progress(msg.getFrom(), vmname, '[3/3] Request completed', message_type=msg.getType(), final=True)
+        self.outbox.send(msg.getFrom(), '{0}: {1}'.format(vmname, self._basic_instance_details(vmname)), message_type=msg.getType())
 
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import threading
+import logging
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# messages per second allowed into a room, and the burst on top of that
+RATE = 1.0
+BURST = 5
+# seconds between batches of progress updates to a room
+INTERVAL = 10
+# longest single message sent to chat
+CHUNK_SIZE = 2000
+
+# shared by every plugin, so all of them draw from the same per-room limit
+_lock = threading.Lock()
+_senders = {}
+_pending = {}
+_last_flush = {}
+
+
+def split_message(text, size):
+    """
+    Split text into chunks of at most size characters,
+    breaking on newlines where possible
+    """
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > size:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:size])
+            line = line[size:]
+        if current and len(current) + len(line) + 1 > size:
+            chunks.append(current)
+            current = line
+        elif current:
+            current = current + '\n' + line
+        else:
+            current = line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def room_key(to, message_type):
+    """
+    Return the identifier rate limits are kept under. Groupchat
+    senders are stripped down to the room so they share a limit.
+    """
+    if message_type == 'groupchat':
+        get_stripped = getattr(to, 'getStripped', None)
+        if get_stripped is not None:
+            return str(get_stripped())
+        return str(to).split('/', 1)[0]
+    return str(to)
+
+
+class TokenBucket(object):
+    """
+    Allows bursts of up to capacity messages, refilled at rate per second
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self):
+        """
+        Take a token, sleeping until one is available
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            # going negative reserves a future token for this caller
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class RoomSender(threading.Thread):
+    """
+    Background thread sending the queued messages of one room,
+    waiting on the room's token bucket between them
+    """
+
+    def __init__(self, room):
+        super(RoomSender, self).__init__(name='outbox-{0}'.format(room))
+        self.daemon = True
+        self.bucket = TokenBucket(RATE, BURST)
+        self.queue = queue.Queue()
+
+    def run(self):
+        while True:
+            send, to, text, message_type = self.queue.get()
+            self.bucket.consume()
+            try:
+                send(to, text, message_type=message_type)
+            except Exception:
+                logging.exception('Error sending message to {0}'.format(to))
+
+
+def _sender(room):
+    with _lock:
+        if room not in _senders:
+            _senders[room] = RoomSender(room)
+            _senders[room].start()
+        return _senders[room]
+
+
+def _queue(send, to, text, message_type, max_chunks=None):
+    chunks = split_message(text, CHUNK_SIZE)
+    if max_chunks is not None and len(chunks) > max_chunks:
+        dropped = len(chunks) - max_chunks
+        chunks = chunks[:max_chunks] + ['... {0} more messages truncated'.format(dropped)]
+
+    sender = _sender(room_key(to, message_type))
+    for chunk in chunks:
+        sender.queue.put((send, to, chunk, message_type))
+
+
+class Outbox(object):
+    """
+    Throttled output to chat shared by the plugins.
+    Messages are split into bounded chunks and queued per room,
+    progress updates are coalesced per job and sent in batches.
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self.interval = INTERVAL
+
+    def send(self, to, text, message_type='chat', max_chunks=None):
+        """
+        Queue text to be sent in chunks within the room's rate limit
+        """
+        _queue(self._send, to, text, message_type, max_chunks)
+
+    def progress(self, to, job, text, message_type='chat', final=False):
+        """
+        Record a progress update for a job. Only the latest update
+        per job is kept, and a room's updates are sent together
+        once per interval or when a job is final.
+        """
+        room = room_key(to, message_type)
+        with _lock:
+            if room not in _pending:
+                _pending[room] = (self._send, to, message_type, OrderedDict())
+            _pending[room][3][job] = text
+            due = final or time.time() - _last_flush.get(room, 0) >= INTERVAL
+
+        if due:
+            self.flush(room)
+
+    def flush(self, room=None):
+        """
+        Queue pending progress updates for a room, or for every room
+        """
+        with _lock:
+            rooms = [room] if room is not None else list(_pending)
+            batches = []
+            for r in rooms:
+                batch = _pending.pop(r, None)
+                _last_flush[r] = time.time()
+                if batch is not None:
+                    batches.append(batch)
+
+        for send, to, message_type, updates in batches:
+            text = '\n'.join('{0}: {1}'.format(job, update) for job, update in updates.items())
+            _queue(send, to, text, message_type)
@@ -0,0 +1,261 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'err-common'))
+
+from errbot import BotPlugin, botcmd
+
+from pyVmomi import vim, vmodl
+from pyVim.connect import SmartConnect, Disconnect
+
+from libcloud.compute.types import NodeState
+from libcloud.compute.providers import get_driver
+
+import invindex
+import outbox
+import datetime
+import threading
+import logging
+logging.basicConfig(level=logging.DEBUG)
+
+# upper bound on the messages a single listing is split into
+MAX_CHUNKS = 5
+
+VM_PROPERTIES = ['name', 'config.template', 'runtime.host', 'resourcePool',
+                 'runtime.powerState', 'guest.net', 'customValue']
+
+
+def _get_all_props(content, vimtype, path_set):
+    """
+    Fetch the given properties of every object of a type
+    in a single property collector call
+    """
+    view = content.viewManager.CreateContainerView(content.rootFolder, [vimtype], True)
+    traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view',
+                                                             skip=False, type=vim.view.ContainerView)
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+    prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vimtype, pathSet=path_set, all=False)
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+
+    objs = {}
+    try:
+        for result in content.propertyCollector.RetrieveContents([filter_spec]):
+            objs[result.obj] = dict((prop.name, prop.val) for prop in result.propSet)
+    finally:
+        view.Destroy()
+    return objs
+
+
+class Inventory(BotPlugin):
+    """Plugin to query a local index of the vmware and aws inventory"""
+
+    # shared across reactivations, so a scan still running from before
+    # a !config keeps a new one from starting alongside it
+    refreshing = threading.Lock()
+
+    def get_configuration_template(self):
+        """ configuration entries """
+        config = {
+            'user': None,
+            'pass': None,
+            'vcenter': None,
+            'access_id': None,
+            'secret_key': None,
+            'datacenter': None,
+            'refresh_interval': 300,
+            'max_results': 50,
+        }
+        return config
+
+    def activate(self):
+        super(Inventory, self).activate()
+        self.index = invindex.InventoryIndex()
+        self.stopped = threading.Event()
+        self.outbox = outbox.Outbox(self.send)
+
+        # warm start from the last saved snapshot, if any
+        if 'snapshot' in self and not self.index.load(self['snapshot']):
+            logging.info('Discarding incompatible inventory snapshot')
+            del self['snapshot']
+
+        # providers that are no longer configured would never be rescanned
+        configured = set(provider for provider, scan in self._scanners())
+        stale = self.index.providers() - configured
+        for provider in stale:
+            self.index.drop(provider)
+        if stale and 'snapshot' in self:
+            self['snapshot'] = self.index.dump()
+
+        if self.config:
+            # revalidate the snapshot in the background, then keep it fresh
+            thread = threading.Thread(target=self._refresh)
+            thread.daemon = True
+            thread.start()
+            self.start_poller(self.config['refresh_interval'], self._refresh)
+
+    def deactivate(self):
+        # a scan still running must not write to the closed storage
+        self.stopped.set()
+        super(Inventory, self).deactivate()
+
+    def _scan_vmware(self):
+        """ returns a list of nodes for every vm in vcenter """
+        si = SmartConnect(host=self.config['vcenter'], user=self.config['user'],
+                          pwd=self.config['pass'], port=443)
+        try:
+            content = si.RetrieveContent()
+            hosts = _get_all_props(content, vim.HostSystem, ['name'])
+            pools = _get_all_props(content, vim.ResourcePool, ['name'])
+            fields = dict((f.key, f.name) for f in content.customFieldsManager.field or [])
+            vms = _get_all_props(content, vim.VirtualMachine, VM_PROPERTIES)
+        finally:
+            Disconnect(si)
+
+        nodes = []
+        for vm, props in vms.items():
+            if props.get('config.template'):
+                continue
+            host = hosts.get(props.get('runtime.host'), {}).get('name')
+            pool = pools.get(props.get('resourcePool'), {}).get('name')
+            ips = [ip for nic in props.get('guest.net') or [] for ip in nic.ipAddress or []]
+            tags = dict((fields.get(v.key, v.key), v.value) for v in props.get('customValue') or [])
+            nodes.append(invindex.make_node('vmware', vm._moId, props['name'], host=host, pool=pool,
+                                            state=props.get('runtime.powerState'), ips=ips, tags=tags))
+        return nodes
+
+    def _scan_aws(self):
+        """ returns a list of nodes for every aws instance """
+        cls = get_driver(self.config['datacenter'])
+        driver = cls(self.config['access_id'], self.config['secret_key'])
+
+        nodes = []
+        for instance in driver.list_nodes():
+            # aws has no hypervisor host, the availability zone stands in as the pool
+            nodes.append(invindex.make_node('aws', instance.id, instance.name,
+                                            pool=instance.extra.get('availability'),
+                                            state=NodeState.tostring(instance.state),
+                                            ips=instance.private_ips + instance.public_ips,
+                                            tags=instance.extra.get('tags')))
+        return nodes
+
+    def _refresh(self, wait=False):
+        """ rescan every configured provider and update the index """
+        # bind to this activation, a reactivation replaces both
+        index, stopped = self.index, self.stopped
+
+        # the poller and a manual refresh may overlap, only scan once.
+        # a manual refresh waits for the running scan and uses its result
+        if not self.refreshing.acquire(False):
+            if wait:
+                with self.refreshing:
+                    pass
+            return
+        try:
+            self._refresh_providers(index, stopped)
+        finally:
+            self.refreshing.release()
+
+    def _scanners(self):
+        """ returns (provider, scan method) pairs for the configured providers """
+        scanners = []
+        if not self.config:
+            return scanners
+        if self.config['vcenter']:
+            scanners.append(('vmware', self._scan_vmware))
+        if self.config['access_id']:
+            scanners.append(('aws', self._scan_aws))
+        return scanners
+
+    def _refresh_providers(self, index, stopped):
+        scanned = False
+        for provider, scan in self._scanners():
+            if stopped.is_set():
+                return
+            try:
+                nodes = scan()
+            except Exception:
+                logging.exception('Error scanning {0} inventory'.format(provider))
+                continue
+            added, changed, removed = index.replace(provider, nodes)
+            logging.info('{0} inventory: {1} added, {2} changed, {3} removed'.format(
+                provider, added, changed, removed))
+            scanned = True
+
+        # save even when nothing changed so the scan times stay current
+        if scanned and not stopped.is_set():
+            self['snapshot'] = index.dump()
+
+    def _format_node(self, node):
+        return u'{0} [{1}] {2} host={3} pool={4} ip={5}'.format(
+            node.name, node.provider, node.state, node.host or '-',
+            node.pool or '-', ','.join(node.ips) or '-')
+
+    @botcmd(split_args_with=' ')
+    def inventory(self, msg, args):
+        ''' query the local vmware/aws inventory
+            options:
+                provider (str): vmware or aws
+                host (str): esx host
+                pool (str): resource pool or availability zone
+                state (str): power state, ie running or stopped
+                tag (str): tag key or key=value
+                ip (str): ip address
+                name (str): name, glob patterns allowed
+            example:
+            !inventory host=esx12
+            !inventory tag=team=systems
+            !inventory pool=DEV state=stopped
+        '''
+        if not self.config:
+            return 'Plugin not configured, see !config Inventory'
+
+        filters = []
+        name = None
+        for arg in args:
+            if not arg:
+                continue
+            if '=' not in arg:
+                return 'Invalid filter "{0}", expected field=value.'.format(arg)
+            field, value = arg.split('=', 1)
+            if field == 'name':
+                name = value
+            elif field in invindex.INDEXED_FIELDS:
+                filters.append((field, value))
+            else:
+                return 'Unknown field "{0}". Valid fields: name, {1}'.format(
+                    field, ', '.join(invindex.INDEXED_FIELDS))
+
+        nodes = self.index.query(filters, name=name)
+        if not nodes:
+            return 'No matching nodes.'
+
+        max_results = self.config['max_results']
+        lines = [self._format_node(node) for node in nodes[:max_results]]
+        if len(nodes) > max_results:
+            lines.append('... {0} more'.format(len(nodes) - max_results))
+        self.outbox.send(msg.getFrom(), '\n'.join(lines), message_type=msg.getType(),
+                         max_chunks=MAX_CHUNKS)
+
+    @botcmd
+    def inventory_refresh(self, msg, args):
+        ''' rescan vmware/aws and update the local inventory
+            example:
+            !inventory refresh
+        '''
+        if not self.config:
+            return 'Plugin not configured, see !config Inventory'
+
+        self._refresh(wait=True)
+        return 'Inventory refreshed, {0} nodes indexed.'.format(len(self.index))
+
+    @botcmd
+    def inventory_status(self, msg, args):
+        ''' show how many nodes are indexed and when each provider was last scanned
+            example:
+            !inventory status
+        '''
+        lines = ['{0} nodes indexed.'.format(len(self.index))]
+        for provider, updated in sorted(self.index.updated.items()):
+            lines.append('{0}: last scanned {1}'.format(
+                provider, datetime.datetime.fromtimestamp(updated).strftime('%Y-%m-%d %H:%M:%S')))
+        return '\n'.join(lines)
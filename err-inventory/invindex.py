@@ -0,0 +1,191 @@
+from collections import namedtuple
+import fnmatch
+import threading
+import time
+
+# a single inventory entry, kept as a tuple so large inventories stay small
+Node = namedtuple('Node', ['provider', 'id', 'name', 'host', 'pool', 'state', 'ips', 'tags'])
+
+# bump whenever Node changes so stale snapshots are discarded
+SNAPSHOT_VERSION = 1
+
+# fields with a secondary index, in the order they are accepted by queries
+INDEXED_FIELDS = ('provider', 'host', 'pool', 'state', 'tag', 'ip')
+
+# vmware and aws report power states differently, fold them together
+STATE_ALIASES = {
+    'poweredon': 'running',
+    'poweredoff': 'stopped',
+}
+
+
+def normalize_state(state):
+    """
+    Lower case a power state and map it to its common name
+    """
+    if state is None:
+        return None
+    state = state.lower()
+    return STATE_ALIASES.get(state, state)
+
+
+def make_node(provider, id, name, host=None, pool=None, state=None, ips=(), tags=None):
+    """
+    Build a Node, with ips and tags turned into sorted tuples
+    """
+    tags = tags or {}
+    return Node(provider, id, name, host, pool, normalize_state(state),
+                tuple(sorted(ip for ip in ips if ip)),
+                tuple(sorted(u'{0}={1}'.format(k, v) for k, v in tags.items())))
+
+
+def _index_keys(node):
+    """
+    Yield (field, value) pairs a node is indexed under
+    """
+    yield 'provider', node.provider.lower()
+    if node.host:
+        yield 'host', node.host.lower()
+    if node.pool:
+        yield 'pool', node.pool.lower()
+    if node.state:
+        yield 'state', node.state
+    for tag in node.tags:
+        # index both "key" and "key=value" so either can be queried
+        yield 'tag', tag.split('=', 1)[0].lower()
+        yield 'tag', tag.lower()
+    for ip in node.ips:
+        yield 'ip', ip.lower()
+
+
+class InventoryIndex(object):
+    """
+    In-memory inventory of nodes with secondary indexes on
+    provider, host, pool, power state, tag and ip.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {}
+        self.indexes = dict((field, {}) for field in INDEXED_FIELDS)
+        self.updated = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _add(self, key, node):
+        self.nodes[key] = node
+        for field, value in _index_keys(node):
+            self.indexes[field].setdefault(value, set()).add(key)
+
+    def _remove(self, key):
+        node = self.nodes.pop(key)
+        for field, value in _index_keys(node):
+            keys = self.indexes[field].get(value)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.indexes[field][value]
+
+    def replace(self, provider, nodes):
+        """
+        Replace every node of a provider with a fresh scan,
+        only touching the entries that actually changed.
+        Returns a tuple of (added, changed, removed) counts.
+        """
+        fresh = dict(((node.provider, node.id), node) for node in nodes)
+        added = changed = removed = 0
+
+        with self.lock:
+            stale = [key for key in self.nodes if key[0] == provider and key not in fresh]
+            for key in stale:
+                self._remove(key)
+                removed += 1
+
+            for key, node in fresh.items():
+                current = self.nodes.get(key)
+                if current == node:
+                    continue
+                if current is None:
+                    added += 1
+                else:
+                    self._remove(key)
+                    changed += 1
+                self._add(key, node)
+
+            self.updated[provider] = time.time()
+
+        return added, changed, removed
+
+    def drop(self, provider):
+        """
+        Remove every node of a provider along with its scan time
+        """
+        with self.lock:
+            for key in [key for key in self.nodes if key[0] == provider]:
+                self._remove(key)
+            self.updated.pop(provider, None)
+
+    def providers(self):
+        """
+        Return the set of providers with indexed nodes or a scan time
+        """
+        with self.lock:
+            return set(key[0] for key in self.nodes) | set(self.updated)
+
+    def dump(self):
+        """
+        Return a compact, picklable snapshot of the index
+        """
+        with self.lock:
+            return {
+                'version': SNAPSHOT_VERSION,
+                'updated': dict(self.updated),
+                'nodes': [tuple(node) for node in self.nodes.values()],
+            }
+
+    def load(self, snapshot):
+        """
+        Fill the index from a snapshot made by dump().
+        Returns False if the snapshot is from an incompatible version.
+        """
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return False
+
+        with self.lock:
+            for values in snapshot['nodes']:
+                node = Node(*values)
+                self._add((node.provider, node.id), node)
+            self.updated.update(snapshot['updated'])
+        return True
+
+    def query(self, filters=None, name=None):
+        """
+        Return the nodes matching every (field, value) filter,
+        optionally restricted to names matching a glob pattern.
+        """
+        filters = filters or []
+
+        with self.lock:
+            keys = None
+            for field, value in filters:
+                if field not in self.indexes:
+                    raise KeyError(field)
+                if field == 'state':
+                    value = normalize_state(value)
+                else:
+                    value = value.lower()
+                matches = self.indexes[field].get(value, set())
+                keys = set(matches) if keys is None else keys & matches
+                if not keys:
+                    return []
+
+            if keys is None:
+                keys = self.nodes.keys()
+            nodes = [self.nodes[key] for key in keys]
+
+        if name is not None:
+            nodes = [n for n in nodes if fnmatch.fnmatch(n.name.lower(), name.lower())]
+
+        return sorted(nodes, key=lambda n: (n.provider, n.name))
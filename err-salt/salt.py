@@ -1,7 +1,11 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'err-common'))
+
 from errbot import BotPlugin, botcmd
 from optparse import OptionParser
 
-import sys
+import outbox
 import pepper
 import json
 import urllib
@@ -19,9 +23,14 @@ class Salt(BotPlugin):
             'api_user': None,
             'api_pass': None,
             'api_auth': None,
+            'max_chunks': 10,
         }
         return config
 
+    def activate(self):
+        super(Salt, self).activate()
+        self.outbox = outbox.Outbox(self.send)
+
     def paste_code(self, code):
         ''' Post the output to pastebin '''
         request = urllib2.Request(
@@ -43,7 +52,7 @@ class Salt(BotPlugin):
 
         if len(args) < 2:
             response = '2 parameters required. see !help salt'
-            self.send(msg.getFrom(), response, message_type=msg.getType())
+            self.outbox.send(msg.getFrom(), response, message_type=msg.getType())
             return
 
         targets = args.pop(0)
@@ -53,4 +62,10 @@ class Salt(BotPlugin):
         auth = api.login(self.config['api_user'], self.config['api_pass'], self.config['api_auth'])
         ret = api.local(targets, action, arg=args, kwarg=None, expr_form='pcre')
         results = json.dumps(ret, sort_keys=True, indent=4)
-        self.send(msg.getFrom(), self.paste_code(results), message_type=msg.getType())
+
+        if self.config['paste_api_url']:
+            self.outbox.send(msg.getFrom(), self.paste_code(results), message_type=msg.getType())
+        else:
+            # no pastebin, post the results inline in bounded chunks
+            self.outbox.send(msg.getFrom(), results, message_type=msg.getType(),
+                             max_chunks=self.config.get('max_chunks', 10))
@@ -1,6 +1,7 @@
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'err-common'))
 
 from errbot import BotPlugin, botcmd
 from optparse import OptionParser
@@ -11,6 +12,7 @@ import time
 import datetime
 import random
 import vmutils
+import outbox
 import logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -31,6 +33,10 @@ class VMware(BotPlugin):
         }
         return config
 
+    def activate(self):
+        super(VMware, self).activate()
+        self.outbox = outbox.Outbox(self.send)
+        self.start_poller(self.outbox.interval, self.outbox.flush)
 
     @botcmd(split_args_with=' ')
     def vmware_migrate(self, msg, args):
@@ -53,14 +59,16 @@ class VMware(BotPlugin):
         except:
             err_text = 'Error connecting to {0}'.format(vcenter)
             logging.info(err_text)
-            return err_text
+            self.outbox.send(msg.getFrom(), err_text, message_type=msg.getType())
+            return
 
         if hostname:
             try:
                 host = vmutils.get_host_by_name(si, hostname)
                 hostname = host.name
             except:
-                return '{0} not found'.format(hostname)
+                self.outbox.send(msg.getFrom(), '{0} not found'.format(hostname), message_type=msg.getType())
+                return
         else:
             # hostname was not passed
             all_hosts = vmutils.get_hosts(si)
@@ -71,7 +79,8 @@ class VMware(BotPlugin):
         try:
             vm = vmutils.get_vm_by_name(si, vmname)
         except:
-            return '{0} not found.'.format(vmname)
+            self.outbox.send(msg.getFrom(), '{0} not found.'.format(vmname), message_type=msg.getType())
+            return
 
         # relocate spec, to migrate to another host
         # this can do other things, like storage and resource pool
@@ -81,7 +90,7 @@ class VMware(BotPlugin):
         # does the actual migration to host
         vm.Relocate(relocate_spec)
         Disconnect(si)
-        return 'Migrating {0} to {1}'.format(vmname, hostname)
+        self.outbox.send(msg.getFrom(), 'Migrating {0} to {1}'.format(vmname, hostname), message_type=msg.getType())
 
     @botcmd
     def vmware_reboot_vm(self, msg, args):
@@ -100,13 +109,15 @@ class VMware(BotPlugin):
         except:
             err_text = 'Error connecting to {0}'.format(vcenter)
             logging.info(err_text)
-            return err_text
+            self.outbox.send(msg.getFrom(), err_text, message_type=msg.getType())
+            return
 
         # Finding source VM
         try:
             vm = vmutils.get_vm_by_name(si, vmname)
         except:
-            return '{0} not found.'.format(vmname)
+            self.outbox.send(msg.getFrom(), '{0} not found.'.format(vmname), message_type=msg.getType())
+            return
 
         try:
             vm.RebootGuest()
@@ -114,7 +125,7 @@ class VMware(BotPlugin):
             vm.ResetVM_Task()
 
         Disconnect(si)
-        return 'Rebooting {0}'.format(vmname)
+        self.outbox.send(msg.getFrom(), 'Rebooting {0}'.format(vmname), message_type=msg.getType())
 
 
     @botcmd
@@ -166,11 +177,11 @@ class VMware(BotPlugin):
         except IOError, e:
             err_text = 'Error connecting to {0}'.format(data['vcenter'])
             logging.info(err_text)
-            yield err_text
+            self.outbox.send(msg.getFrom(), err_text, message_type=msg.getType())
             return
 
         if vmutils.get_vm_by_name(si, vmname):
-            yield 'VM "{0}" already exists.'.format(vmname)
+            self.outbox.send(msg.getFrom(), 'VM "{0}" already exists.'.format(vmname), message_type=msg.getType())
             return
 
         # Finding source VM
@@ -210,7 +221,7 @@ class VMware(BotPlugin):
                                   folder=template_vm.parent,
                                   spec=cloneSpec)
 
-        self.send(msg.getFrom(), '{0}: [1/3] Cloning'.format(vmname), message_type=msg.getType())
+        self.outbox.progress(msg.getFrom(), vmname, '[1/3] Cloning', message_type=msg.getType())
 
         # Checking clone progress
         time.sleep(5)
@@ -229,7 +240,7 @@ class VMware(BotPlugin):
         # Credentials used to login to the guest system
         creds = vmutils.login_in_guest(username=vm_username, password=vm_password)
 
-        self.send(msg.getFrom(), '{0}: [2/3] Running post setup'.format(vmname), message_type=msg.getType())
+        self.outbox.progress(msg.getFrom(), vmname, '[2/3] Running post setup', message_type=msg.getType())
         pid = vmutils.start_process(si=si, vm=vm_clone, auth=creds, program_path='/bin/sed', args='-i "/^HOST/s:$:.{0}:" /etc/sysconfig/network'.format(data['dnsdomain']))
         #pid = vmutils.start_process(si=si, vm=vm_clone, auth=creds, program_path='/bin/sed', args='-i "/^127.0.1.1/d" /etc/hosts')
         pid = vmutils.start_process(si=si, vm=vm_clone, auth=creds, program_path='/sbin/reboot', args='')
@@ -243,5 +254,5 @@ class VMware(BotPlugin):
             pid = vmutils.start_process(si=si, vm=vm_clone, auth=creds, program_path='/bin/echo', args='$(A=$(facter ipaddress); B=$(facter hostname); C=${B}.{0}; echo $A $C $B >> /etc/hosts)'.format(data['dnsdomain']))
             pid = vmutils.start_process(si=si, vm=vm_clone, auth=creds, program_path='/usr/bin/puppet', args='agent --test')
 
-        self.send(msg.getFrom(), '{0}: [3/3] Request completed'.format(vmname), message_type=msg.getType())
+        self.outbox.progress(msg.getFrom(), vmname, '[3/3] Request completed', message_type=msg.getType(), final=True)
 